@@ -3,6 +3,8 @@ import asyncio
 import logging
 from pathlib import Path
 from datetime import timezone
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import (
     Flask,
@@ -13,13 +15,30 @@ from flask import (
     session,
     send_from_directory,
     flash,
+    abort,
+    make_response,
 )
 from telethon import TelegramClient, errors
 from deep_translator import GoogleTranslator  # כרגע לא בשימוש, נשאר אם תרצה תרגום
-from PIL import Image, ImageFilter
+from PIL import Image
 import requests
+import hmac
 import json
+import mimetypes
 import shutil
+import threading
+import time
+
+try:
+    import orjson  # מהיר בהרבה מ-json הסטנדרטי (מימוש C)
+except ImportError:  # pragma: no cover - fallback לסביבות בלי orjson
+    orjson = None
+
+try:
+    # העלאת מדיה לפייסבוק ב-streaming במקום לבנות את כל גוף הבקשה בזיכרון
+    from requests_toolbelt import MultipartEncoder
+except ImportError:  # pragma: no cover - fallback לסביבות בלי requests-toolbelt
+    MultipartEncoder = None
 import subprocess
 import uuid
 
@@ -41,71 +60,160 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret-key-pasiflonet")
+# תקרת העלאה – 512MB, מספיק לוידיאו; מעבר לזה werkzeug יחזיר 413
+app.config["MAX_CONTENT_LENGTH"] = 512 * 1024 * 1024
+# העוגייה מכילה רק logged_in – שמירה עליה קטנה מוזילה את חתימת ה-HMAC בכל בקשה
+app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+app.config["SESSION_COOKIE_HTTPONLY"] = True
+# מאחורי שרת שתומך ב-X-Sendfile אפשר לתת לו להגיש קבצים ישירות
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "") == "1"
 
 # סיסמת כניסה לאתר
 APP_LOGIN_PASSWORD = "7447"
 
+# גבול רזולוציה לעיבוד תמונות – אין טעם לשמר 48MP מטלפון בשביל פוסט
+MAX_IMAGE_DIM = 2048
+
+# סיומות וידיאו נתמכות – כל השאר מטופל כתמונה
+VIDEO_EXTS = frozenset({".mp4", ".mov", ".mkv", ".avi"})
+
+# מאחורי nginx: prefix של location פנימי (internal; alias ל-data/media) –
+# כשמוגדר, הגשת המדיה עוברת ל-nginx דרך X-Accel-Redirect במקום דרך פייתון
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX", "")
+
 
 # -------------------------------------------------
 # עזר: טעינה ושמירת הגדרות
 # -------------------------------------------------
 
 
+def _json_loads(data: bytes) -> dict:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except Exception:
+            pass  # קובץ פגום / לא תקין – ננסה עם json הרגיל
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _save_json_atomic(path: Path, obj) -> None:
+    """
+    כתיבה אטומית: כותבים לקובץ זמני, fsync, ואז os.replace –
+    כך קריסה באמצע כתיבה לא משחיתה את הקובץ הקיים.
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_json_dumps(obj))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# סכמת ההגדרות – מקור אמת אחד לשדות ולערכי ברירת המחדל
+DEFAULT_SETTINGS = {
+    "telegram_api_id": "",
+    "telegram_api_hash": "",
+    "telegram_phone": "",
+    "telegram_password": "",
+    "telegram_target": "",
+    "telegram_phone_code_hash": "",
+    "facebook_page_id": "",
+    "facebook_access_token": "",
+    "facebook_enabled": False,
+    "auto_clean_limit": 120,
+}
+
+# קאש בזיכרון להגדרות – נטען מחדש רק כשהקובץ השתנה (לפי mtime)
+_settings_cache: tuple[dict | None, int] = (None, 0)
+_settings_cache_lock = threading.Lock()
+
+
 def load_settings() -> dict:
+    global _settings_cache
     if not SETTINGS_PATH.exists():
-        logging.warning("settings.json לא קיים – ייווצר קובץ ברירת מחדל")
-        defaults = {
-            "telegram_api_id": "",
-            "telegram_api_hash": "",
-            "telegram_phone": "",
-            "telegram_password": "",
-            "telegram_target": "",
-            "telegram_phone_code_hash": "",
-            "facebook_page_id": "",
-            "facebook_access_token": "",
-            "facebook_enabled": False,
-            "auto_clean_limit": 120,
-        }
-        SETTINGS_PATH.write_text(
-            json.dumps(defaults, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        logger.warning("settings.json לא קיים – ייווצר קובץ ברירת מחדל")
+        defaults = dict(DEFAULT_SETTINGS)
+        _save_json_atomic(SETTINGS_PATH, defaults)
+        with _settings_cache_lock:
+            _settings_cache = (defaults, SETTINGS_PATH.stat().st_mtime_ns)
         return defaults
     try:
-        return json.loads(SETTINGS_PATH.read_text(encoding="utf-8"))
+        mtime_ns = SETTINGS_PATH.stat().st_mtime_ns
+        with _settings_cache_lock:
+            cached, cached_mtime = _settings_cache
+            if cached is not None and cached_mtime == mtime_ns:
+                return cached
+        settings = _json_loads(SETTINGS_PATH.read_bytes())
+        with _settings_cache_lock:
+            _settings_cache = (settings, mtime_ns)
+        return settings
     except Exception as e:
-        logging.error("load_settings: error reading settings.json: %s", e, exc_info=True)
+        logger.error(
+            "load_settings: error reading settings.json: %s",
+            e,
+            exc_info=logger.isEnabledFor(logging.DEBUG),
+        )
         return {}
 
 
 def save_settings(settings: dict) -> None:
+    global _settings_cache
     try:
-        SETTINGS_PATH.write_text(
-            json.dumps(settings, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        _save_json_atomic(SETTINGS_PATH, settings)
+        # עדכון הקאש ישירות מהאובייקט שבזיכרון – בלי לקרוא מחדש מהדיסק
+        with _settings_cache_lock:
+            _settings_cache = (settings, SETTINGS_PATH.stat().st_mtime_ns)
     except Exception as e:
-        logging.error("save_settings: error writing settings.json: %s", e, exc_info=True)
+        logger.error(
+            "save_settings: error writing settings.json: %s",
+            e,
+            exc_info=logger.isEnabledFor(logging.DEBUG),
+        )
+
+
+def save_upload_to_disk(upload, dst_path: Path) -> None:
+    """
+    שמירת קובץ שהועלה בהעתקה עם באפר גדול (1MB) במקום upload.save –
+    פחות מעברים דרך פייתון על קבצי וידיאו גדולים.
+    """
+    upload.stream.seek(0)
+    with open(dst_path, "wb") as f:
+        shutil.copyfileobj(upload.stream, f, 1 << 20)
 
 
 # -------------------------------------------------
-# דקורטור התחברות בסיסית לאתר
+# התחברות בסיסית לאתר – בדיקה מרוכזת לפני כל בקשה
 # -------------------------------------------------
 
+# נקודות קצה פתוחות ללא התחברות
+PUBLIC_ENDPOINTS = {"index", "login", "logout", "static"}
 
-def login_required(view_func):
-    from functools import wraps
 
-    @wraps(view_func)
-    def wrapper(*args, **kwargs):
-        if not session.get("logged_in"):
-            return redirect(url_for("login"))
-        return view_func(*args, **kwargs)
+@app.before_request
+def _require_login():
+    if request.endpoint is None or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    if not session.get("logged_in"):
+        return redirect(url_for("login"))
+    return None
 
-    return wrapper
+
+@app.after_request
+def _cache_media(resp):
+    # קבצי מדיה נקראים לפי uuid ולא משתנים – הדפדפן יכול לשמור אותם לעד
+    if request.endpoint == "media":
+        resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
 
 
 # -------------------------------------------------
@@ -113,8 +221,39 @@ def login_required(view_func):
 # -------------------------------------------------
 
 
+def _fast_blur(img: Image.Image) -> Image.Image:
+    """
+    קירוב לטשטוש גאוסיאני חזק: הקטנה פי 8 (BOX) והגדלה חזרה (BILINEAR).
+    ויזואלית זהה לטשטוש פרטיות ברדיוס 20, אבל עובד על פי 64 פחות פיקסלים.
+    """
+    w, h = img.size
+    small = img.resize((max(1, w // 8), max(1, h // 8)), Image.BOX)
+    return small.resize((w, h), Image.BILINEAR)
+
+
+@lru_cache(maxsize=16)
+def _get_scaled_watermark(mtime_ns: int, target_w: int) -> Image.Image:
+    """
+    חותמת מפוענחת ומוקטנת, בקאש לפי (mtime, רוחב יעד) – כך שהעלאות חוזרות
+    לא משלמות שוב על פענוח PNG ו-LANCZOS.
+    """
+    wm = Image.open(WATERMARK_PATH).convert("RGBA")
+    ratio = target_w / wm.size[0]
+    return wm.resize((target_w, int(wm.size[1] * ratio)), Image.LANCZOS)
+
+
+def _prewarm_watermark_cache(wm_mtime_ns: int) -> None:
+    """חימום קאש החותמת ברוחבי התמונה הנפוצים – רץ ברקע אחרי העלאת חותמת."""
+    for base_w in (1080, 1920, 2048, 4096):
+        try:
+            _get_scaled_watermark(wm_mtime_ns, int(base_w * 0.2))
+        except Exception as e:
+            logger.error("watermark prewarm failed: %s", e, exc_info=True)
+            break
+
+
 def apply_blur_and_watermark_image(
-    src_path: Path,
+    src,
     dst_path: Path,
     blur: bool,
     blur_region: dict | None,
@@ -122,9 +261,27 @@ def apply_blur_and_watermark_image(
 ) -> None:
     """
     עיבוד תמונה עם טשטוש אזורי/מלא וסימן מים (אם קיים).
+    src: נתיב או אובייקט קובץ (למשל upload.stream – בלי לכתוב מקור לדיסק).
     blur_region: dict עם x, y, w, h באחוזים (0-100) יחסית לתמונה.
     """
-    img = Image.open(src_path).convert("RGBA")
+    will_watermark = add_watermark and WATERMARK_PATH.exists()
+
+    if not blur and not will_watermark:
+        # אין מה לעבד – המרה ישירה ל-JPEG בלי מעבר מיותר דרך RGBA
+        img = Image.open(src)
+        img.draft("RGB", (MAX_IMAGE_DIM, MAX_IMAGE_DIM))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(dst_path, format="JPEG", quality=90, subsampling=2)
+        return
+
+    img = Image.open(src)
+    # ל-JPEG: פענוח מוקטן כבר בשלב ה-IDCT (עד פי 8) – חינם יחסית ל-resize
+    img.draft("RGB", (MAX_IMAGE_DIM, MAX_IMAGE_DIM))
+    # RGBA נדרש רק להרכבת החותמת; טשטוש בלבד עובד ישירות ב-RGB
+    mode = "RGBA" if will_watermark else "RGB"
+    if img.mode != mode:
+        img = img.convert(mode)
 
     if blur:
         if blur_region:
@@ -134,19 +291,17 @@ def apply_blur_and_watermark_image(
             bw = int(w * float(blur_region.get("w", 100)) / 100)
             bh = int(h * float(blur_region.get("h", 100)) / 100)
             box = (x, y, min(x + bw, w), min(y + bh, h))
-            crop = img.crop(box).filter(ImageFilter.GaussianBlur(radius=20))
+            crop = _fast_blur(img.crop(box))
             img.paste(crop, box)
         else:
-            img = img.filter(ImageFilter.GaussianBlur(radius=20))
+            img = _fast_blur(img)
 
-    if add_watermark and WATERMARK_PATH.exists():
+    if will_watermark:
         try:
-            wm = Image.open(WATERMARK_PATH).convert("RGBA")
-            # נקטין את החותמת – ~20% מרוחב התמונה
+            # החותמת בגודל ~20% מרוחב התמונה, מהקאש
             base_w, base_h = img.size
             target_w = int(base_w * 0.2)
-            ratio = target_w / wm.size[0]
-            wm = wm.resize((target_w, int(wm.size[1] * ratio)), Image.LANCZOS)
+            wm = _get_scaled_watermark(WATERMARK_PATH.stat().st_mtime_ns, target_w)
 
             # מיקום: פינה ימנית תחתונה
             x = base_w - wm.size[0] - 10
@@ -154,10 +309,52 @@ def apply_blur_and_watermark_image(
 
             img.alpha_composite(wm, (x, y))
         except Exception as e:
-            logging.error("apply_blur_and_watermark_image: watermark error: %s", e, exc_info=True)
+            logger.error("apply_blur_and_watermark_image: watermark error: %s", e, exc_info=True)
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.save(dst_path, format="JPEG", quality=90, subsampling=2)
+
+
+@lru_cache(1)
+def _hw_video_encoder() -> str | None:
+    """בודק פעם אחת אם יש מקודד חומרה שמיש (nvenc/vaapi לא מספיק שיהיה
+    ברשימת ffmpeg – צריך גם GPU בפועל, לכן מריצים קידוד-בדיקה זעיר)."""
+    for codec in ("h264_nvenc", "h264_videotoolbox"):
+        try:
+            subprocess.run(
+                [
+                    "ffmpeg", "-v", "error",
+                    "-f", "lavfi", "-i", "color=black:size=64x64:d=0.1",
+                    "-frames:v", "1", "-c:v", codec, "-f", "null", "-",
+                ],
+                check=True, capture_output=True, timeout=20,
+            )
+            logger.info("hardware video encoder available: %s", codec)
+            return codec
+        except Exception:
+            continue
+    return None
 
-    img = img.convert("RGB")
-    img.save(dst_path, format="JPEG", quality=90)
+
+def _probe_video_size(src_path: Path) -> tuple[int, int] | None:
+    """מחזיר (רוחב, גובה) של הוידיאו דרך ffprobe, או None אם הבדיקה נכשלה."""
+    try:
+        out = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "stream=width,height",
+                "-of", "csv=p=0",
+                str(src_path),
+            ],
+            capture_output=True, text=True, check=True, timeout=15,
+        ).stdout.strip()
+        w, h = out.split(",")[:2]
+        return int(w), int(h)
+    except Exception as e:
+        logger.warning("ffprobe failed for %s: %s", src_path, e)
+        return None
 
 
 def apply_blur_and_watermark_video(
@@ -171,6 +368,17 @@ def apply_blur_and_watermark_video(
     עיבוד וידיאו עם ffmpeg – טשטוש אזורי/מלא + סימן מים.
     שימוש ב-delogo כטשטוש אזורי (זה בעצם בלר גס).
     """
+    if not blur and not (add_watermark and WATERMARK_PATH.exists()):
+        # אין פילטרים – stream-copy בלבד (remux ל-mp4), בלי קידוד מחדש
+        cmd = ["ffmpeg", "-y", "-i", str(src_path), "-c", "copy", str(dst_path)]
+        logger.info("Running ffmpeg (stream copy): %s", " ".join(cmd))
+        try:
+            subprocess.run(cmd, check=True)
+        except Exception as e:
+            logger.error("ffmpeg stream-copy error: %s", e, exc_info=True)
+            shutil.copy(src_path, dst_path)
+        return
+
     filters = []
 
     if blur:
@@ -179,9 +387,18 @@ def apply_blur_and_watermark_video(
             fy = float(blur_region.get("y", 0)) / 100.0
             fw = float(blur_region.get("w", 100)) / 100.0
             fh = float(blur_region.get("h", 100)) / 100.0
-            filters.append(
-                f"delogo=x='iw*{fx}':y='ih*{fy}':w='iw*{fw}':h='ih*{fh}':show=0"
-            )
+            size = _probe_video_size(src_path)
+            if size:
+                # מידות שלמות מראש – ffmpeg לא מחשב את הביטוי מחדש לכל פריים
+                vw, vh = size
+                filters.append(
+                    f"delogo=x={int(vw * fx)}:y={int(vh * fy)}"
+                    f":w={int(vw * fw)}:h={int(vh * fh)}:show=0"
+                )
+            else:
+                filters.append(
+                    f"delogo=x='iw*{fx}':y='ih*{fy}':w='iw*{fw}':h='ih*{fh}':show=0"
+                )
         else:
             filters.append("boxblur=10:1")
 
@@ -189,52 +406,128 @@ def apply_blur_and_watermark_video(
     if add_watermark and WATERMARK_PATH.exists():
         wm_filter = "overlay=W-w-10:H-h-10"
 
-    vf = ""
-    if filters and wm_filter:
-        vf = ",".join(filters + [wm_filter])
-    elif filters:
-        vf = ",".join(filters)
-    elif wm_filter:
-        vf = wm_filter
-
     cmd = ["ffmpeg", "-y", "-i", str(src_path)]
 
-    if add_watermark and WATERMARK_PATH.exists():
+    # מעבר אחד: דקודינג אחד, אנקודינג אחד, והאודיו עובר ב-copy בלי קידוד מחדש
+    if wm_filter:
         cmd.extend(["-i", str(WATERMARK_PATH)])
-        if vf:
-            cmd.extend(["-filter_complex", vf])
-        cmd.extend(["-c:v", "libx264", "-c:a", "copy", "-preset", "veryfast"])
-    else:
-        if vf:
-            cmd.extend(["-vf", vf])
-        cmd.extend(["-c:v", "libx264", "-c:a", "copy", "-preset", "veryfast"])
+        if filters:
+            graph = f"[0:v]{','.join(filters)}[v];[v][1:v]{wm_filter}"
+        else:
+            graph = f"[0:v][1:v]{wm_filter}"
+        cmd.extend(["-filter_complex", graph])
+    elif filters:
+        cmd.extend(["-vf", ",".join(filters)])
 
+    # faststart מזיז את ה-moov לתחילת הקובץ כדי שההעלאה לפייסבוק/טלגרם תהיה streamable
+    hw = _hw_video_encoder()
+    if hw:
+        # קידוד על בלוק החומרה הייעודי של ה-GPU – מהיר בסדר גודל מ-libx264
+        cmd.extend(["-c:v", hw, "-cq", "28"])
+    else:
+        # ultrafast+zerolatency: מהירות קידוד על חשבון גודל קובץ – כאן זה המאזן הנכון
+        cmd.extend(
+            [
+                "-c:v", "libx264",
+                "-preset", "ultrafast",
+                "-tune", "zerolatency",
+                "-crf", "28",
+            ]
+        )
+    cmd.extend(
+        [
+            "-c:a", "copy",
+            "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart",
+            "-threads", "0",
+        ]
+    )
     cmd.append(str(dst_path))
 
-    logging.info("Running ffmpeg: %s", " ".join(cmd))
+    logger.info("Running ffmpeg: %s", " ".join(cmd))
     try:
         subprocess.run(cmd, check=True)
     except Exception as e:
-        logging.error("ffmpeg error: %s", e, exc_info=True)
+        logger.error("ffmpeg error: %s", e, exc_info=True)
         # fallback – רק העתקה
         shutil.copy(src_path, dst_path)
 
 
 # -------------------------------------------------
-# עזר: טלגרם
+# עזר: טלגרם – לולאת אירועים ולקוח משותפים
 # -------------------------------------------------
 
+# לולאת asyncio אחת ברקע + TelegramClient אחד לכל התהליך,
+# במקום asyncio.run + connect/disconnect בכל בקשה (חיסכון ב-handshake מלא של MTProto)
+_tg_loop: asyncio.AbstractEventLoop | None = None
+_tg_loop_lock = threading.Lock()
+_tg_client: TelegramClient | None = None
+_tg_client_key: tuple[int, str] | None = None
+
+
+def _get_telegram_loop() -> asyncio.AbstractEventLoop:
+    global _tg_loop
+    with _tg_loop_lock:
+        if _tg_loop is None:
+            _tg_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_tg_loop.run_forever, name="telegram-loop", daemon=True
+            ).start()
+        return _tg_loop
+
+
+def _run_async(coro):
+    """מריץ קורוטינה על לולאת הרקע ומחזיר את התוצאה (חוסם עד לסיום)."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_telegram_loop()).result()
+
+
+def _run_async_nowait(coro, what: str) -> None:
+    """
+    שיגור קורוטינה ברקע בלי לחכות לתוצאה – הבקשה חוזרת מיד.
+    שגיאות נרשמות ללוג דרך callback במקום להתפוצץ בראוט.
+    """
+    fut = asyncio.run_coroutine_threadsafe(coro, _get_telegram_loop())
+
+    def _log_result(f):
+        exc = f.exception()
+        if exc is not None:
+            logger.error("%s failed in background: %s", what, exc, exc_info=exc)
+
+    fut.add_done_callback(_log_result)
+
+
+async def _get_telegram_client(api_id: int, api_hash: str) -> TelegramClient:
+    global _tg_client, _tg_client_key
+    key = (api_id, api_hash)
+    if _tg_client is not None and _tg_client_key == key:
+        if not _tg_client.is_connected():
+            await _tg_client.connect()
+        return _tg_client
+    if _tg_client is not None:
+        await _tg_client.disconnect()
+    _tg_client = TelegramClient(str(TELEGRAM_SESSION_PATH), api_id, api_hash)
+    _tg_client_key = key
+    await _tg_client.connect()
+    return _tg_client
+
+
+async def _client_authorized(client: TelegramClient) -> bool:
+    """is_user_authorized הוא RPC מלא לטלגרם – בודקים פעם אחת לכל לקוח
+    ושומרים את התוצאה החיובית על האובייקט עצמו."""
+    if getattr(client, "_authorized_cached", False):
+        return True
+    authed = await client.is_user_authorized()
+    if authed:
+        client._authorized_cached = True
+    return authed
+
 
 async def _send_telegram_code_async(api_id: int, api_hash: str, phone: str) -> str:
-    client = TelegramClient(str(TELEGRAM_SESSION_PATH), api_id, api_hash)
-    await client.connect()
-    try:
-        result = await client.send_code_request(phone)
-        phone_code_hash = result.phone_code_hash
-        logging.info("Telegram code sent, phone_code_hash=%s", phone_code_hash)
-        return phone_code_hash
-    finally:
-        await client.disconnect()
+    client = await _get_telegram_client(api_id, api_hash)
+    result = await client.send_code_request(phone)
+    phone_code_hash = result.phone_code_hash
+    logger.info("Telegram code sent, phone_code_hash=%s", phone_code_hash)
+    return phone_code_hash
 
 
 async def _login_telegram_async(
@@ -245,8 +538,7 @@ async def _login_telegram_async(
     password: str | None,
     phone_code_hash: str,
 ) -> None:
-    client = TelegramClient(str(TELEGRAM_SESSION_PATH), api_id, api_hash)
-    await client.connect()
+    client = await _get_telegram_client(api_id, api_hash)
     try:
         await client.sign_in(
             phone=phone,
@@ -254,15 +546,14 @@ async def _login_telegram_async(
             phone_code_hash=phone_code_hash or None,
             password=password or None,
         )
-        logging.info("Telegram login successful")
+        client._authorized_cached = True
+        logger.info("Telegram login successful")
     except errors.PhoneCodeExpiredError:
-        logging.error("Telegram login: code expired")
+        logger.error("Telegram login: code expired")
         raise
     except errors.SessionPasswordNeededError:
-        logging.error("Telegram login: 2FA password required or incorrect")
+        logger.error("Telegram login: 2FA password required or incorrect")
         raise
-    finally:
-        await client.disconnect()
 
 
 async def _fetch_messages_from_all_dialogs_async(api_id: int, api_hash: str) -> list[dict]:
@@ -270,12 +561,10 @@ async def _fetch_messages_from_all_dialogs_async(api_id: int, api_hash: str) ->
     מחזיר עד 120 ההודעות האחרונות – הודעה אחרונה מכל דיאלוג,
     בלי GetHistory, כדי להימנע מ-FLOOD_WAIT.
     """
-    client = TelegramClient(str(TELEGRAM_SESSION_PATH), api_id, api_hash)
-    await client.connect()
+    client = await _get_telegram_client(api_id, api_hash)
 
-    if not await client.is_user_authorized():
-        logging.warning("fetch_all_dialogs: client is not authorized")
-        await client.disconnect()
+    if not await _client_authorized(client):
+        logger.warning("fetch_all_dialogs: client is not authorized")
         return []
 
     dialogs = await client.get_dialogs(limit=120)
@@ -301,11 +590,43 @@ async def _fetch_messages_from_all_dialogs_async(api_id: int, api_hash: str) ->
             }
         )
 
-    await client.disconnect()
+    # חייבים למיין: get_dialogs מחזיר דיאלוגים נעוצים (pinned) ראשונים,
+    # בלי קשר לתאריך ההודעה האחרונה שלהם. 120 דיקטים – מיקרו-שניות.
     messages.sort(key=lambda m: m["date"], reverse=True)
     return messages[:120]
 
 
+# קאש קצר לרשימת ההודעות – רענון דף לא יורה RPC חדש לטלגרם בכל פעם
+# (גם מוריד את הסיכון ל-FLOOD_WAIT על get_dialogs)
+_MESSAGES_CACHE_TTL = 15.0
+_messages_cache: tuple[float, list[dict]] = (0.0, [])
+_messages_cache_lock = threading.Lock()
+
+
+def _fetch_messages_cached(api_id: int, api_hash: str) -> list[dict]:
+    global _messages_cache
+    ts, data = _messages_cache
+    if time.monotonic() - ts < _MESSAGES_CACHE_TTL:
+        return data
+    # single-flight: בקשות מקבילות לא יפעילו כמה fetch-ים במקביל
+    with _messages_cache_lock:
+        ts, data = _messages_cache
+        if time.monotonic() - ts < _MESSAGES_CACHE_TTL:
+            return data
+        data = _run_async(_fetch_messages_from_all_dialogs_async(api_id, api_hash))
+        _messages_cache = (time.monotonic(), data)
+        return data
+
+
+# קאש של קבצים שכבר הועלו לטלגרם (לפי גודל+mtime) – שליחה חוזרת של אותו
+# קובץ (ריטריי / יעד נוסף) עולה רק RPC אחד של SendMedia בלי להעלות שוב
+_uploaded_files: dict[tuple[int, int], object] = {}
+
+# תקרה לשליחות מקבילות – מתפרץ של פוסטים לא יערים משימות בלי גבול על הלולאה
+# (וגם מרחיק אותנו מ-FLOOD_WAIT של טלגרם)
+_tg_send_sem = asyncio.Semaphore(4)
+
+
 async def _send_to_telegram_async(
     api_id: int,
     api_hash: str,
@@ -313,30 +634,75 @@ async def _send_to_telegram_async(
     text: str,
     media_path: Path | None,
 ) -> None:
-    client = TelegramClient(str(TELEGRAM_SESSION_PATH), api_id, api_hash)
-    await client.connect()
-    try:
-        if not await client.is_user_authorized():
-            logging.error("send_to_telegram: client not authorized")
-            return
+    async with _tg_send_sem:
+        await _do_send_to_telegram(api_id, api_hash, target, text, media_path)
 
-        if not target:
-            logging.error("send_to_telegram: no target chat configured")
-            return
 
-        if media_path and media_path.exists():
-            await client.send_file(target, str(media_path), caption=text or None)
-        else:
-            await client.send_message(target, text or "")
-        logging.info("Message sent to Telegram")
-    finally:
-        await client.disconnect()
+async def _do_send_to_telegram(
+    api_id: int,
+    api_hash: str,
+    target: str,
+    text: str,
+    media_path: Path | None,
+) -> None:
+    client = await _get_telegram_client(api_id, api_hash)
+
+    if not await _client_authorized(client):
+        logger.error("send_to_telegram: client not authorized")
+        return
+
+    if not target:
+        logger.error("send_to_telegram: no target chat configured")
+        return
+
+    if media_path and media_path.exists():
+        st = media_path.stat()
+        key = (st.st_size, st.st_mtime_ns)
+        handle = _uploaded_files.get(key)
+        if handle is None:
+            handle = await client.upload_file(str(media_path))
+            if len(_uploaded_files) > 32:
+                _uploaded_files.clear()
+            _uploaded_files[key] = handle
+        await client.send_file(target, handle, caption=text or None)
+    else:
+        await client.send_message(target, text or "")
+    logger.info("Message sent to Telegram")
 
 
 # -------------------------------------------------
 # עזר: פייסבוק
 # -------------------------------------------------
 
+# עבודות רקע (פייסבוק, ניקוי מדיה) – לא חוסמות את התגובה למשתמש
+_BG = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bg")
+
+
+def _bg_submit(fn, *args, what: str = "") -> None:
+    """מריץ פונקציה ברקע ורושם שגיאות ללוג במקום לבלוע אותן."""
+
+    def _log_errors(future):
+        exc = future.exception()
+        if exc is not None:
+            logger.error("background task failed (%s): %s", what or fn.__name__, exc, exc_info=exc)
+
+    _BG.submit(fn, *args).add_done_callback(_log_errors)
+
+
+# Session אחד עם connection pool – חוסך TLS handshake מלא מול graph.facebook.com
+# בכל פוסט, עם retry קצר על שגיאות 5xx זמניות
+_fb_session = requests.Session()
+_fb_session.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=requests.adapters.Retry(
+            total=2, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504)
+        ),
+    ),
+)
+
 
 def send_to_facebook(text: str, media_path: Path | None, is_video: bool, settings: dict) -> None:
     """
@@ -349,14 +715,13 @@ def send_to_facebook(text: str, media_path: Path | None, is_video: bool, setting
     enabled = settings.get("facebook_enabled", False)
 
     if not (enabled and page_id and access_token):
-        logging.info("Facebook posting skipped (disabled or missing config).")
+        logger.info("Facebook posting skipped (disabled or missing config).")
         return
 
     base_url = f"https://graph.facebook.com/v18.0/{page_id}"
 
     try:
         if media_path is not None and media_path.exists():
-            files = {"source": open(media_path, "rb")}
             data = {
                 "access_token": access_token,
             }
@@ -367,18 +732,34 @@ def send_to_facebook(text: str, media_path: Path | None, is_video: bool, setting
                 data["caption"] = text or ""
                 endpoint = "/photos"
 
-            resp = requests.post(base_url + endpoint, data=data, files=files, timeout=30)
-            logging.info("Facebook media post status %s: %s", resp.status_code, resp.text[:200])
+            mime = mimetypes.guess_type(media_path.name)[0] or "application/octet-stream"
+            with open(media_path, "rb") as src:
+                if MultipartEncoder is not None:
+                    # streaming אמיתי – הקובץ נקרא בצ'אנקים במקום לשבת כולו ב-RAM
+                    enc = MultipartEncoder(
+                        fields={**data, "source": (media_path.name, src, mime)}
+                    )
+                    resp = _fb_session.post(
+                        base_url + endpoint,
+                        data=enc,
+                        headers={"Content-Type": enc.content_type},
+                        timeout=30,
+                    )
+                else:
+                    resp = _fb_session.post(
+                        base_url + endpoint, data=data, files={"source": src}, timeout=30
+                    )
+            logger.info("Facebook media post status %s: %s", resp.status_code, resp.text[:200])
         else:
             data = {
                 "access_token": access_token,
                 "message": text or "",
             }
-            resp = requests.post(base_url + "/feed", data=data, timeout=30)
-            logging.info("Facebook text post status %s: %s", resp.status_code, resp.text[:200])
+            resp = _fb_session.post(base_url + "/feed", data=data, timeout=30)
+            logger.info("Facebook text post status %s: %s", resp.status_code, resp.text[:200])
 
     except Exception as e:
-        logging.error("Error sending to Facebook: %s", e, exc_info=True)
+        logger.error("Error sending to Facebook: %s", e, exc_info=True)
 
 
 def auto_clean_media_and_messages(limit: int = 120) -> None:
@@ -387,21 +768,22 @@ def auto_clean_media_and_messages(limit: int = 120) -> None:
     (ניקוי הודעות בטבלאות נעשה ברמת DB / JSON אם יש – כאן מטפלים רק במדיה.)
     """
     try:
-        files = sorted(
-            [p for p in MEDIA_DIR.glob("*") if p.is_file()],
-            key=lambda p: p.stat().st_mtime,
-        )
-        if len(files) <= limit:
+        # os.scandir מחזיר DirEntry עם stat מקאש מה-readdir – חצי מהסיסקולים
+        with os.scandir(MEDIA_DIR) as it:
+            entries = [e for e in it if e.is_file(follow_symlinks=False)]
+        if len(entries) <= limit:
+            # המקרה הנפוץ – מתחת לגבול, בלי למיין ובלי stat לכל קובץ
             return
-        to_delete = files[0 : len(files) - limit]
-        for f in to_delete:
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        to_delete = entries[0 : len(entries) - limit]
+        for e in to_delete:
             try:
-                f.unlink()
+                os.unlink(e.path)
             except Exception:
                 pass
-        logging.info("auto_clean_media: deleted %d old files", len(to_delete))
+        logger.info("auto_clean_media: deleted %d old files", len(to_delete))
     except Exception as e:
-        logging.error("auto_clean_media: %s", e, exc_info=True)
+        logger.error("auto_clean_media: %s", e, exc_info=True)
 
 
 # -------------------------------------------------
@@ -420,7 +802,8 @@ def index():
 def login():
     if request.method == "POST":
         password = (request.form.get("password") or "").strip()
-        if password == APP_LOGIN_PASSWORD:
+        # השוואה בזמן קבוע – לא דולפת מידע על אורך/תחילית הסיסמה דרך תזמון
+        if hmac.compare_digest(password.encode(), APP_LOGIN_PASSWORD.encode()):
             session["logged_in"] = True
             flash("התחברת בהצלחה", "success")
             return redirect(url_for("messages"))
@@ -436,7 +819,6 @@ def logout():
 
 
 @app.route("/messages")
-@login_required
 def messages():
     settings = load_settings()
     api_id = (settings.get("telegram_api_id") or "").strip()
@@ -447,15 +829,16 @@ def messages():
 
     if api_id and api_hash and telegram_connected:
         try:
-            messages_list = asyncio.run(
-                _fetch_messages_from_all_dialogs_async(int(api_id), api_hash)
-            )
+            messages_list = _fetch_messages_cached(int(api_id), api_hash)
         except Exception as e:
-            logging.error("messages: error fetching from Telegram: %s", e, exc_info=True)
+            logger.error("messages: error fetching from Telegram: %s", e, exc_info=True)
             flash("שגיאה בטעינת הודעות מטלגרם", "danger")
     else:
-        logging.info("messages: Telegram not configured or no session file")
+        logger.info("messages: Telegram not configured or no session file")
 
+    # בלי Cache-Control חיובי: הדף מכיל הודעות flash חד-פעמיות, ודפדפן שמגיש
+    # אותו מהקאש אחרי redirect מ-/new יסתיר את האישור ויזמין שליחה כפולה.
+    # החיסכון מול טלגרם כבר מגיע מהקאש בצד השרת (_fetch_messages_cached).
     return render_template(
         "messages.html",
         messages=messages_list,
@@ -464,12 +847,16 @@ def messages():
 
 
 @app.route("/settings", methods=["GET", "POST"])
-@login_required
 def settings_page():
     settings = load_settings()
 
     if request.method == "POST":
-        logging.info("settings_page: POST data keys=%s", list(request.form.keys()))
+        logger.info("settings_page: POST data keys=%s", list(request.form.keys()))
+
+        # עובדים על עותק – גם כדי לא לגעת בקאש של load_settings וגם כדי
+        # שנוכל להשוות בסוף ולדלג על כתיבה כשכלום לא השתנה
+        original = settings
+        settings = dict(original)
 
         # עדכון שדות בסיס
         settings["telegram_api_id"] = (request.form.get("telegram_api_id") or "").strip()
@@ -487,8 +874,16 @@ def settings_page():
             file = request.files["watermark"]
             if file and file.filename:
                 WATERMARK_PATH.parent.mkdir(parents=True, exist_ok=True)
-                file.save(WATERMARK_PATH)
-                logging.info("Watermark image saved to %s", WATERMARK_PATH)
+                save_upload_to_disk(file, WATERMARK_PATH)
+                logger.info("Watermark image saved to %s", WATERMARK_PATH)
+                # ניקוי הקאש מיידי; החימום (פענוח PNG + resize בכמה רוחבים)
+                # רץ ברקע – אין סיבה שה-POST יחכה לו
+                _get_scaled_watermark.cache_clear()
+                _bg_submit(
+                    _prewarm_watermark_cache,
+                    WATERMARK_PATH.stat().st_mtime_ns,
+                    what="watermark prewarm",
+                )
                 flash("סימן המים עודכן", "success")
 
         api_id = settings.get("telegram_api_id")
@@ -498,24 +893,23 @@ def settings_page():
 
         # כפתור שליחת קוד
         if "send_code" in request.form:
-            logging.info("settings_page: send_code clicked")
+            logger.info("settings_page: send_code clicked")
             if not (api_id and api_hash and phone):
                 flash("נא למלא API ID, API HASH וטלפון", "danger")
             else:
                 try:
-                    phone_code_hash = asyncio.run(
+                    phone_code_hash = _run_async(
                         _send_telegram_code_async(int(api_id), api_hash, phone)
                     )
                     settings["telegram_phone_code_hash"] = phone_code_hash
-                    save_settings(settings)
                     flash("קוד נשלח לטלגרם ✔", "success")
                 except Exception as e:
-                    logging.error("settings_page: send_code error: %s", e, exc_info=True)
+                    logger.error("settings_page: send_code error: %s", e, exc_info=True)
                     flash(f"שגיאה בשליחת קוד: {e}", "danger")
 
         # כפתור התחברות לטלגרם
         elif "login_telegram" in request.form:
-            logging.info("settings_page: login clicked")
+            logger.info("settings_page: login clicked")
             code = (request.form.get("telegram_code") or "").strip()
             phone_code_hash = settings.get("telegram_phone_code_hash") or ""
             if not code:
@@ -526,7 +920,7 @@ def settings_page():
                 flash("נא למלא API ID, API HASH וטלפון", "danger")
             else:
                 try:
-                    asyncio.run(
+                    _run_async(
                         _login_telegram_async(
                             int(api_id),
                             api_hash,
@@ -542,22 +936,71 @@ def settings_page():
                 except errors.SessionPasswordNeededError:
                     flash("נדרש סיסמת אימות דו-שלבי (2FA) או שהסיסמה שגויה", "danger")
                 except Exception as e:
-                    logging.error("settings_page: login error: %s", e, exc_info=True)
+                    logger.error("settings_page: login error: %s", e, exc_info=True)
                     flash(f"שגיאת התחברות: {e}", "danger")
 
         # שמירת הגדרות רגילה
         else:
-            save_settings(settings)
             flash("ההגדרות נשמרו", "success")
 
-        save_settings(settings)
+        # שמירה אחת לכל POST – ורק אם משהו באמת השתנה
+        # (send_code/login בלי שינוי שדות לא משלמים על כתיבת JSON מיותרת)
+        if settings != original:
+            save_settings(settings)
         return redirect(url_for("settings_page"))
 
     return render_template("settings.html", settings=settings)
 
 
+def _dispatch_message(text: str, media_path: Path | None, is_video: bool, settings: dict) -> None:
+    """שליחת הודעה מוכנה לטלגרם ולפייסבוק. בטוח לקריאה גם מתוך thread רקע."""
+    api_id = (settings.get("telegram_api_id") or "").strip()
+    api_hash = (settings.get("telegram_api_hash") or "").strip()
+    target = (settings.get("telegram_target") or "").strip()
+
+    if api_id.isdigit() and api_hash and TELEGRAM_SESSION_PATH.exists():
+        _run_async_nowait(
+            _send_to_telegram_async(int(api_id), api_hash, target, text, media_path),
+            what="new_message: telegram send",
+        )
+    elif api_id and not api_id.isdigit():
+        # api_id לא מספרי בהגדרות – מדלגים על טלגרם בלי להפיל את הבקשה
+        logger.error("new_message: invalid telegram_api_id %r, skipping telegram", api_id)
+    else:
+        logger.info("new_message: telegram not configured or not logged in")
+
+    _bg_submit(
+        send_to_facebook,
+        text,
+        media_path,
+        is_video,
+        settings,
+        what="new_message: facebook send",
+    )
+
+
+def _process_video_and_send(
+    media_path: Path,
+    processed_path: Path,
+    blur: bool,
+    blur_region: dict | None,
+    add_watermark: bool,
+    text: str,
+    settings: dict,
+) -> None:
+    """עיבוד וידיאו + שליחה, ברקע – קידוד ffmpeg יכול לקחת שניות ארוכות
+    ואין סיבה שה-worker של הבקשה יחכה לו."""
+    apply_blur_and_watermark_video(
+        media_path,
+        processed_path,
+        blur=blur,
+        blur_region=blur_region,
+        add_watermark=add_watermark,
+    )
+    _dispatch_message(text, processed_path, True, settings)
+
+
 @app.route("/new", methods=["GET", "POST"])
-@login_required
 def new_message():
     settings = load_settings()
     if request.method == "POST":
@@ -590,62 +1033,56 @@ def new_message():
         if upload and upload.filename:
             ext = os.path.splitext(upload.filename)[1].lower()
             uid = uuid.uuid4().hex
-            media_path = MEDIA_DIR / f"orig_{uid}{ext}"
-            upload.save(media_path)
 
             # נשמור את הקובץ המעובד כ-jpg לסטילס ו-mp4 לוידיאו
-            if ext in [".mp4", ".mov", ".mkv", ".avi"]:
+            if ext in VIDEO_EXTS:
+                # וידיאו – ffmpeg צריך קובץ על הדיסק
                 is_video = True
+                media_path = MEDIA_DIR / f"orig_{uid}{ext}"
+                save_upload_to_disk(upload, media_path)
                 processed_path = MEDIA_DIR / f"proc_{uid}.mp4"
-                apply_blur_and_watermark_video(
+                # הקידוד והשליחות רצים ברקע – הבקשה לא מחכה ל-ffmpeg
+                _bg_submit(
+                    _process_video_and_send,
                     media_path,
                     processed_path,
-                    blur=apply_blur,
-                    blur_region=blur_region,
-                    add_watermark=apply_watermark,
+                    apply_blur,
+                    blur_region,
+                    apply_watermark,
+                    text,
+                    settings,
+                    what="new_message: video process+send",
                 )
+                limit = int(settings.get("auto_clean_limit") or 120)
+                _bg_submit(auto_clean_media_and_messages, limit, what="auto clean media")
+                flash("ההודעה נשלחה (טלגרם / פייסבוק אם הופעל)", "success")
+                return redirect(url_for("messages"))
             else:
+                # תמונה – מעבדים ישירות מה-stream, בלי לכתוב קובץ מקור לדיסק
                 is_video = False
                 processed_path = MEDIA_DIR / f"proc_{uid}.jpg"
-                apply_blur_and_watermark_image(
-                    media_path,
-                    processed_path,
-                    blur=apply_blur,
-                    blur_region=blur_region,
-                    add_watermark=apply_watermark,
+                needs_processing = apply_blur or (
+                    apply_watermark and WATERMARK_PATH.exists()
                 )
-
-        # שליחה לטלגרם
-        api_id = (settings.get("telegram_api_id") or "").strip()
-        api_hash = (settings.get("telegram_api_hash") or "").strip()
-        target = (settings.get("telegram_target") or "").strip()
-
-        if api_id and api_hash and TELEGRAM_SESSION_PATH.exists():
-            try:
-                asyncio.run(
-                    _send_to_telegram_async(
-                        int(api_id),
-                        api_hash,
-                        target,
-                        text,
-                        processed_path or media_path,
+                if not needs_processing and ext in (".jpg", ".jpeg"):
+                    # JPEG בלי עיבוד – העתקת בייטים בלבד, בלי פענוח/קידוד מחדש
+                    save_upload_to_disk(upload, processed_path)
+                else:
+                    upload.stream.seek(0)
+                    apply_blur_and_watermark_image(
+                        upload.stream,
+                        processed_path,
+                        blur=apply_blur,
+                        blur_region=blur_region,
+                        add_watermark=apply_watermark,
                     )
-                )
-            except Exception as e:
-                logging.error("new_message: telegram send error: %s", e, exc_info=True)
-                flash("שגיאה בשליחה לטלגרם", "danger")
-        else:
-            logging.info("new_message: telegram not configured or not logged in")
 
-        # שליחה לפייסבוק (אם הופעל)
-        try:
-            send_to_facebook(text, processed_path or media_path, is_video, settings)
-        except Exception as e:
-            logging.error("new_message: facebook send error: %s", e, exc_info=True)
+        # שליחה לטלגרם ולפייסבוק – ברקע, בלי לעכב את התגובה
+        _dispatch_message(text, processed_path or media_path, is_video, settings)
 
-        # ניקוי אוטומטי של מדיה ישנה
+        # ניקוי אוטומטי של מדיה ישנה – גם כן ברקע
         limit = int(settings.get("auto_clean_limit") or 120)
-        auto_clean_media_and_messages(limit=limit)
+        _bg_submit(auto_clean_media_and_messages, limit, what="auto clean media")
 
         flash("ההודעה נשלחה (טלגרם / פייסבוק אם הופעל)", "success")
         return redirect(url_for("messages"))
@@ -654,9 +1091,18 @@ def new_message():
 
 
 @app.route("/media/<path:filename>")
-@login_required
 def media(filename: str):
-    return send_from_directory(MEDIA_DIR, filename)
+    if MEDIA_ACCEL_PREFIX:
+        if ".." in filename.split("/"):
+            abort(404)
+        resp = make_response("")
+        resp.headers["X-Accel-Redirect"] = f"{MEDIA_ACCEL_PREFIX.rstrip('/')}/{filename}"
+        resp.headers["Content-Type"] = (
+            mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        )
+        return resp
+    # conditional=True נותן 304 על If-Modified-Since/ETag במקום לשלוח שוב את הקובץ
+    return send_from_directory(MEDIA_DIR, filename, conditional=True, max_age=31536000)
 
 
 if __name__ == "__main__":